@@ -7,9 +7,363 @@ Recommended manuals
  2.エラーコード in FX5 User's manual(Ethernet connection)
  3.デバイスコード一覧 in FX5 User's manual(MC protocol)
 '''
+import errno
 import socket
 import struct
-from threading import RLock
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from queue import LifoQueue
+from threading import Lock
+
+# SLMP request frames (binary, 3E frame) for one device point.
+# Only the device number (offset 15-17) and the write data (offset 21-)
+# change per call, so each request is patched into a copy of its template.
+_READ_M_TEMPLATE = bytes([
+    0x50, 0x00, # sub header（fixed FX5U）
+    0x00, # required network number（fixed FX5U）
+    0xFF, # required area code（fixed FX5U）
+    0xFF, 0x03, # required unit I/O number（fixed FX5U）
+    0x00, # required multi drop area code（fixed FX5U）
+    0x0C, 0x00, # required data length (byte size after reserved code)
+    0x00, 0x00, # reserved code
+    0x01, 0x04, # read command with bulk
+    0x01, 0x00, # sub command（bit unit）
+    0x00, 0x00, 0x00, # first device number（from lower byte）
+    0x90, # device code 90=M
+    0x01, 0x00 # device point（fixed 1）
+])
+_WRITE_M_TEMPLATE = bytes([
+    0x50, 0x00,
+    0x00,
+    0xFF,
+    0xFF, 0x03,
+    0x00,
+    0x0D, 0x00,
+    0x00, 0x00,
+    0x01, 0x14, # write command with bulk
+    0x01, 0x00,
+    0x00, 0x00, 0x00,
+    0x90, # device code 90=M
+    0x01, 0x00,
+    0x00 # write data
+])
+_READ_D_TEMPLATE = bytes([
+    0x50, 0x00,
+    0x00,
+    0xFF,
+    0xFF, 0x03,
+    0x00,
+    0x0C, 0x00,
+    0x00, 0x00,
+    0x01, 0x04,
+    0x00, 0x00, # sub command（word unit）
+    0x00, 0x00, 0x00,
+    0xA8, # device code A8=D
+    0x01, 0x00
+])
+_WRITE_D_TEMPLATE = bytes([
+    0x50, 0x00,
+    0x00,
+    0xFF,
+    0xFF, 0x03,
+    0x00,
+    0x0E, 0x00,
+    0x00, 0x00,
+    0x01, 0x14,
+    0x00, 0x00,
+    0x00, 0x00, 0x00,
+    0xA8, # device code A8=D
+    0x01, 0x00,
+    0x00, 0x00 # write data (low, high)
+])
+_WRITE_RANDOM_TEMPLATE = bytes([
+    0x50, 0x00,
+    0x00,
+    0xFF,
+    0xFF, 0x03,
+    0x00,
+    0x00, 0x00, # required data length (set per request)
+    0x00, 0x00,
+    0x02, 0x14, # write command with random
+    0x00, 0x00 # sub command (0000=word unit, 0001=bit unit)
+])
+# entries of write random: device number, device code, write data
+_RANDOM_WORD = struct.Struct('<HBBH')
+_RANDOM_BIT = struct.Struct('<HBBB')
+# max points in one write random frame
+_MAX_RANDOM_WORDS = 80
+_MAX_RANDOM_BITS = 188
+# max points in one bulk (block) read/write frame
+_MAX_BLOCK_WORDS = 960
+_MAX_BLOCK_BITS = 7168
+# bit unit data has 2 devices in a byte: shift of the even device (upper 4bit)
+# and the odd device (lower 4bit)
+_BIT_SHIFTS = (4, 0)
+# max devices kept by read_cached() (the least recently read one is dropped)
+_MAX_READ_CACHE = 1024
+# device number (3 bytes from lower byte)
+_DEVNO = struct.Struct('<3B')
+# unsigned/signed 16-bit (little endian)
+_U16 = struct.Struct('<H')
+_I16 = struct.Struct('<h')
+_unpack_u16 = _U16.unpack_from
+# TCP_QUICKACK is Linux only
+_TCP_QUICKACK = getattr(socket, 'TCP_QUICKACK', None)
+
+class _FramingError(Exception):
+    '''The PLC doesn't answer requests sent in a row.
+
+    A response is not a SLMP frame (responses are out of order), or only the
+    first responses of a batch came back.
+    '''
+
+def _end_code_error(code):
+    '''Make the exception raised when the PLC returns an end code (exp: 0xC059).'''
+    return Exception('Error code: 0x%04X %s' % (code, FX5.error_message(code)))
+
+def _word(value):
+    '''Convert a value of device 'D' to unsigned 16-bit for write data.
+
+    Args:
+        value (int): -32768 to 65535 (signed or unsigned 16-bit)
+
+    Return:
+        int: unsigned 16-bit
+    '''
+    value = int(value)
+    if not -32768 <= value <= 65535:
+        raise Exception("Out of range of 16-bit value: " + str(value))
+    return value & 0xffff
+
+@lru_cache(maxsize=1024)
+def _frame(template, devno):
+    '''Build a request frame from a template and a device number.
+
+    Polling loops use the same devices again and again, so frames are cached.
+    Write data is patched into a copy of the frame by the caller.
+
+    Args:
+        template (bytes): frame template (exp: _READ_D_TEMPLATE)
+        devno (int): device number
+
+    Return:
+        bytes: request frame
+    '''
+    buf = bytearray(template)
+    _DEVNO.pack_into(buf, 15, devno & 0xff, devno>>8 & 0xff, devno>>16 & 0xff)
+    return bytes(buf)
+
+class DevHandle:
+    '''Device parsed by FX5.compile(), so reading it again doesn't parse a name.
+
+    Handles are cached and shared by all callers, so they are read-only.
+
+    Attributes:
+        type (str): device type ('M' or 'D')
+        no (int): device number
+    '''
+    __slots__ = ('type', 'no', '_frame')
+
+    def __init__(self, dev_type, no):
+        if dev_type == 'M':
+            template = _READ_M_TEMPLATE
+        elif dev_type == 'D':
+            template = _READ_D_TEMPLATE
+        else:
+            raise Exception("Unsupported device type")
+        set_attr = object.__setattr__
+        set_attr(self, 'type', dev_type)
+        set_attr(self, 'no', no)
+        set_attr(self, '_frame', _frame(template, no)) # read request frame
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DevHandle is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("DevHandle is read-only")
+
+    def __repr__(self):
+        return 'DevHandle(' + self.type + str(self.no) + ')'
+
+@lru_cache(maxsize=1024)
+def _parse_devname(devno):
+    '''Parse a device name (exp: D500) to DevHandle.'''
+    return DevHandle(devno[0], int(devno[1:]))
+
+def _write_bit_frame(devno, on):
+    '''Build a write frame of a device 'M'.
+
+    Args:
+        devno (int): device number
+        on (bool): 1=True, 0=False
+
+    Return:
+        bytearray: request frame
+    '''
+    buf = bytearray(_frame(_WRITE_M_TEMPLATE, devno))
+    buf[21] = 0x10 if on == True else 0x00 # write data
+    return buf
+
+def _write_word_frame(devno, value):
+    '''Build a write frame of a device 'D'.
+
+    Args:
+        devno (int): device number
+        value (int): -32768 to 65535
+
+    Return:
+        bytearray: request frame
+    '''
+    buf = bytearray(_frame(_WRITE_D_TEMPLATE, devno))
+    _U16.pack_into(buf, 21, _word(value)) # low, high
+    return buf
+
+def _write_string_frame(devno, data):
+    '''Build a write frame of a device 'D' as ASCII code.
+
+    Args:
+        devno (int): device number
+        data (str): strings (from 0 length to 2 length)
+
+    Return:
+        bytearray: request frame
+    '''
+    if len(data) > 2:
+        raise Exception("you can write only 2 words")
+    buf = bytearray(_frame(_WRITE_D_TEMPLATE, devno))
+    buf[21], buf[22] = FX5.to_ascii(str(data)) # low, high
+    return buf
+
+def _numpy():
+    '''Import numpy (only read_d_block/read_m_block need it).'''
+    try:
+        import numpy
+    except ImportError:
+        raise Exception("numpy is required")
+    return numpy
+
+def _read_block_frame(devno, count):
+    '''Build a bulk read frame of consecutive devices.
+
+    Args:
+        devno (str): first device name (exp: D500)
+        count (int): number of devices
+
+    Return:
+        bytearray: request frame
+    '''
+    dev_type = devno[0]
+    dev_no = int(devno[1:])
+    if dev_type == 'M':
+        template = _READ_M_TEMPLATE
+        max_count = _MAX_BLOCK_BITS
+    elif dev_type == 'D':
+        template = _READ_D_TEMPLATE
+        max_count = _MAX_BLOCK_WORDS
+    else:
+        raise Exception("Unsupported device type")
+    if not 1 <= count <= max_count:
+        raise Exception("Out of range of device points: " + str(count))
+    buf = bytearray(_frame(template, dev_no))
+    _U16.pack_into(buf, 19, count) # device point
+    return buf
+
+def _decode_block(dev_type, re, count, as_ascii=False):
+    '''Decode responsed data of a bulk read.
+
+    Args:
+        dev_type (str): device type ('M' or 'D')
+        re (bytes): responsed data
+        count (int): number of devices
+        as_ascii (bool): decode 'D' as ASCII code
+
+    Return:
+        list or str: values of devices (bool for 'M', int for 'D').
+    '''
+    if dev_type == 'M':
+        return [(re[i >> 1] >> _BIT_SHIFTS[i & 1] & 0x0f) == 0x01 for i in range(count)]
+    if as_ascii:
+        return FX5.to_string_block(re)
+    return [value for (value,) in _I16.iter_unpack(re)]
+
+def _write_block_frame(devno, values):
+    '''Build a bulk write frame of consecutive devices.
+
+    Args:
+        devno (str): first device name (exp: D500)
+        values (list): values of devices (1 or 0 for 'M', int for 'D')
+
+    Return:
+        bytearray: request frame
+    '''
+    dev_type = devno[0]
+    dev_no = int(devno[1:])
+    count = len(values)
+    if dev_type == 'M':
+        template = _WRITE_M_TEMPLATE
+        max_count = _MAX_BLOCK_BITS
+    elif dev_type == 'D':
+        template = _WRITE_D_TEMPLATE
+        max_count = _MAX_BLOCK_WORDS
+    else:
+        raise Exception("Unsupported device type")
+    if not 1 <= count <= max_count:
+        raise Exception("Out of range of device points: " + str(count))
+    # allocate the whole frame once, and patch write data into it
+    size = (count + 1) // 2 if dev_type == 'M' else count * 2
+    buf = bytearray(21 + size)
+    buf[:21] = _frame(template, dev_no)[:21] # without write data
+    _U16.pack_into(buf, 7, 12 + size) # required data length
+    _U16.pack_into(buf, 19, count) # device point
+    if dev_type == 'M':
+        for i, value in enumerate(values):
+            if int(value) == True:
+                buf[21 + (i >> 1)] |= 0x01 << _BIT_SHIFTS[i & 1]
+    else:
+        for i, value in enumerate(values):
+            _U16.pack_into(buf, 21 + i * 2, _word(value))
+    return buf
+
+def _write_random_d_frame(words):
+    '''Build a write random frame of some devices 'D'.
+
+    Args:
+        words (list): (device number, value) of each device
+
+    Return:
+        bytearray: request frame
+    '''
+    buf = bytearray(17 + len(words) * _RANDOM_WORD.size)
+    buf[:15] = _WRITE_RANDOM_TEMPLATE
+    _U16.pack_into(buf, 7, len(buf) - 9) # required data length
+    buf[15] = len(words) # word access points
+    buf[16] = 0 # double word access points
+    offset = 17
+    for devno, value in words:
+        _RANDOM_WORD.pack_into(buf, offset, devno & 0xffff, devno>>16 & 0xff, 0xA8, _word(value))
+        offset += _RANDOM_WORD.size
+    return buf
+
+def _write_random_m_frame(bits):
+    '''Build a write random frame of some devices 'M'.
+
+    Args:
+        bits (list): (device number, 1 or 0) of each device
+
+    Return:
+        bytearray: request frame
+    '''
+    buf = bytearray(16 + len(bits) * _RANDOM_BIT.size)
+    buf[:15] = _WRITE_RANDOM_TEMPLATE
+    _U16.pack_into(buf, 7, len(buf) - 9) # required data length
+    buf[13] = 0x01 # sub command（bit unit）
+    buf[15] = len(bits) # bit access points
+    offset = 16
+    for devno, on in bits:
+        _RANDOM_BIT.pack_into(buf, offset, devno & 0xffff, devno>>16 & 0xff, 0x90, 0x01 if on == True else 0x00)
+        offset += _RANDOM_BIT.size
+    return buf
 
 '''
 Example
@@ -22,33 +376,114 @@ Example
 class FX5:
 
     __connections = {}
+    __connections_lock = Lock()
 
     #If you use same a host, you should use same an instance.
     @classmethod
-    def get_connection(cls, host):
-        if host not in cls.__connections:
-            cls.__connections[host] = FX5(host)
-        return cls.__connections[host]
+    def get_connection(cls, host, socket_options=None):
+        con = cls.__connections.get(host)
+        if con is None:
+            # '192.168.01.10:2555' is same as '192.168.1.10:2555'
+            # (resolve it before the lock, because DNS may take a long time)
+            key = cls.__normalize_host(host)
+            # lock only when creating, so two threads don't create two sockets
+            with cls.__connections_lock:
+                con = cls.__connections.get(host) or cls.__connections.get(key)
+                if con is None:
+                    con = cls.__connections[key] = FX5(host, socket_options)
+                cls.__connections[host] = con
+        return con
+
+    @staticmethod
+    def __normalize_host(host):
+        '''Resolve a host to 'IP address:Port number' (exp: 192.168.1.10:2555)'''
+        ip, port = host.split(':')
+        try:
+            addr = socket.getaddrinfo(ip, int(port), socket.AF_INET, socket.SOCK_STREAM)[0][4]
+        except socket.gaierror:
+            return host
+        return addr[0] + ':' + str(addr[1])
     
+    __pools = {}
+
+    @classmethod
+    @contextmanager
+    def borrow(cls, host, maxsize=None, socket_options=None):
+        '''Borrow a connection from the pool of a host.
+
+        Unlike get_connection(), each thread gets its own connection (socket),
+        so threads can read/write at the same time.
+        Note: One port uses only one device in FX5, so maxsize is 1 by default.
+        Set maxsize only when the PLC accepts more connections on the port.
+
+        exp)
+        with FX5.borrow('192.168.1.10:2555') as fx5:
+            fx5.read('D500')
+
+        Args:
+            host (str): IP address:Port number
+            maxsize (int): max connections of the host (default 1).
+                The pool is made at the first call, so a later call can't change it.
+            socket_options (list): extra (level, option, value) for setsockopt (see __init__)
+        '''
+        if maxsize is not None and maxsize < 1:
+            raise Exception("maxsize must be 1 or more: " + str(maxsize))
+        pool = cls.__pools.get(host)
+        if pool is None:
+            # same host names as get_connection() (resolved before the lock)
+            key = cls.__normalize_host(host)
+            with cls.__connections_lock:
+                pool = cls.__pools.get(host)
+                if pool is None:
+                    pool = cls.__pools.get(key)
+                if pool is None:
+                    pool = cls.__pools[key] = LifoQueue(maxsize or 1)
+                    for _ in range(pool.maxsize):
+                        pool.put(None) # connect when it is used first
+                cls.__pools[host] = pool
+        if maxsize is not None and maxsize != pool.maxsize:
+            raise Exception("The pool of %s has already %d connections" % (host, pool.maxsize))
+        con = pool.get() # wait until a connection is returned
+        try:
+            if con is None:
+                con = FX5(host, socket_options)
+            yield con
+        finally:
+            pool.put(con)
+
     @classmethod
     def close_all(cls):
         '''Close all connections'''
-        for con_host in cls.__connections:
-            con = cls.get_connection(con_host)
+        # a connection may be registered with some host names
+        for con in {id(con): con for con in list(cls.__connections.values())}.values():
             con.close()
-
-    __ip = None
-    __port = None
-    __client = None
-    __lock = RLock()
-    __isopen = False
+        for pool in {id(pool): pool for pool in list(cls.__pools.values())}.values():
+            for con in list(pool.queue):
+                if con is not None:
+                    con.close() # it connects again when it is used
 
     '''
     Args:
         host (str): IP address:Port number
+        socket_options (list): extra (level, option, value) for setsockopt
+            (exp: [(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)])
     '''
-    def __init__(self, host):
+    def __init__(self, host, socket_options=None):
         self.__ip, self.__port = host.split(':')
+        self.__client = None
+        self.__isopen = False
+        self.__socket_options = tuple(socket_options or ())
+        # each PLC has its own lock (not re-entered, so Lock is enough)
+        self.__lock = Lock()
+        # receive buffer (max response is 7168 bits(3584 bytes) + header)
+        self.__rxbuf = bytearray(4096)
+        self.__rxmv = memoryview(self.__rxbuf)
+        # max requests sent before waiting for responses (see __send_many)
+        self.__window = 4
+        # first end code of the last __transfer
+        self.__code = 0
+        # (device, as_ascii): (time, value) of read_cached()
+        self.__read_cache = {}
     
     def __str__(self):
         return self.__ip + ":" + self.__port + " " + ("Open" if self.__isopen else "Close")
@@ -58,54 +493,171 @@ class FX5:
         #未接続なら接続
         if not self.__isopen:
             self.__client = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # IPv4,TCP
+            # SLMP is small request/response, so don't wait for Nagle and delayed ACK
+            self.__client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if _TCP_QUICKACK is not None:
+                self.__client.setsockopt(socket.IPPROTO_TCP, _TCP_QUICKACK, 1)
+            # detect a dead connection while it is idle
+            self.__client.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, 'TCP_KEEPIDLE'): # Linux only
+                self.__client.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30) # 秒
+                self.__client.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 5) # 秒
+                self.__client.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+            for level, option, value in self.__socket_options:
+                self.__client.setsockopt(level, option, value)
             self.__client.settimeout(2) # 秒
             self.__client.connect((self.__ip, int(self.__port))) # IPとPORTを指定してバインドします
             self.__isopen = True
 
-    def __send(self, data):
+    def __send(self, data, decode=bytes):
         '''Send instruction words to PLC on TCP socket connection.
 
         When some errors occur, it will throw error codes with hexadecimal.
 
         Args:
-            data (list): data sentence
+            data (bytearray): data sentence
+            decode (function): it is called with a memoryview of responsed data
+                while the receive buffer is locked (exp: _I16.unpack_from)
         
         Return:
-            list: responsed data with array (exp: [10, 20, ....])
+            bytes: responsed data without end code (exp: 1E 00 for D=30)
+                or the result of decode
+        '''
+        with self.__lock:
+            size = self.__transfer((data,), 1)
+
+            # Sample
+            # 0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 15 16 17 18 19
+            # D0-00-00-FF-FF-03-00-03-00-00-00-10-00-00-00-00-00-00-00-00
+            # End code (offset 9-10) is not 0 when the PLC returns an error
+            code = _unpack_u16(self.__rxbuf, 9)[0]
+            if code:
+                raise _end_code_error(code)
+
+            # If there are no erros, it returns responsed data
+            # (bytes() copies it, because the buffer is reused by the next request)
+            return decode(self.__rxmv[11:size]) # exclude end code(2byte)
+
+    def __send_many(self, frames):
+        '''Send some write frames, and receive the responses together.
+
+        Up to __window requests are sent before waiting for the responses,
+        so the PLC processes the next request while the last response travels.
+        The PLC answers in order of requests. If the PLC rejects requests
+        in a row (a broken response, or only the first responses of a batch
+        came back), it sends one request at a time from then.
+        A plain timeout doesn't change it, because a slow PLC also causes it.
+
+        Args:
+            frames (list): data sentences
         '''
+        if not frames:
+            return
         with self.__lock:
+            try:
+                self.__transfer(frames, self.__window)
+            except _FramingError as e:
+                if self.__window == 1:
+                    raise e
+                # Write frames can be sent again, because they only set values.
+                self.__window = 1
+                self.__transfer(frames, 1)
+            code = self.__code
+            if code:
+                raise _end_code_error(code)
+
+    def __transfer(self, frames, window):
+        '''Send frames and receive the responses (call it with the lock).
+
+        The PLC may have dropped the connection while it was idle (reset,
+        or found dead by keep-alive), so it connects again and retries only once.
+        When the PLC returns an error, it stops after the responses of the batch.
+
+        Args:
+            frames (list): data sentences
+            window (int): max requests sent before waiting for the responses
+
+        Return:
+            int: byte size of the last response in the receive buffer
+                (the first end code is stored in __code)
+        '''
+        done = 0 # frames which the PLC has answered
+        for retry in range(2):
+            idle = self.__isopen # opened by an earlier call
+            sent = False
+            answered = 0 # responses of the current batch
             try:
                 self.__open()
-                self.__client.sendall(data)
-                result = self.__client.recv(128)
-
-                # check errors
-                if len(result) < 11:
-                    # Length of responsed data is required over 11 bytes
-                    # Note: One port uses only one device in FX5.
-                    raise Exception('Connection error. It already may connect other device.' + str(len(result)))
+                code = 0
+                while done < len(frames):
+                    batch = frames[done:done + window]
+                    self.__client.sendall(batch[0] if len(batch) == 1 else b''.join(batch))
+                    sent = True
+                    answered = 0
+                    for _ in batch:
+                        # receive all responses, even if one of them is an error
+                        size = self.__recv()
+                        answered += 1
+                        code = code or _unpack_u16(self.__rxbuf, 9)[0]
+                    done += len(batch)
+                    if code:
+                        break
+                self.__code = code
+                return size
+            except OSError as e:
+                self.close()
+                if isinstance(e, socket.timeout) and e.errno is None: # by settimeout()
+                    if answered:
+                        # the PLC answered the first requests of the batch only
+                        raise _FramingError('Requests in a row are not answered. ' + str(answered)) from e
+                    raise e
+                # ETIMEDOUT is reported by keep-alive, and any error of the first
+                # send means the idle connection is dead.
+                # (it doesn't wait before the retry, because the lock is held)
+                dropped = isinstance(e, ConnectionError) or e.errno == errno.ETIMEDOUT or (idle and not sent)
+                if retry or not dropped:
+                    raise e
             except Exception as e:
                 self.close()
                 raise e
 
-            # Sample
-            # 0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 15 16 17 18 19
-            # D0-00-00-FF-FF-03-00-03-00-00-00-10-00-00-00-00-00-00-00-00
-            if format(result[9], '#04x') != '0x00' and format(result[10], '#04x') != '0x00':
-                # Sum 2 bytes(the second byte must be 8-bit shift) to get unsigned 16-bit integer
-                res_u16bit = self.to_int16_unsigned(result[10], result[9])
-                if res_u16bit in self.__error:
-                    errmsg = self.__error[res_u16bit]
-                else:
-                    errmsg = "unknown error"
-                raise Exception('Error code: ' + str(res_u16bit) + " " + errmsg)
+    def __recv(self):
+        '''Receive one response frame into the receive buffer.
 
-            # If there are no erros, it returns responsed data
-            length = self.to_int16_signed(result[8], result[7]) - 2 # exclude end code(2byte)
-            re = []
-            for i in range(length):
-                re.append(result[11 + i])
-            return re
+        TCP may split a frame, so it reads until the data length (offset 7-8)
+        has been received.
+
+        Return:
+            int: byte size of the response frame
+        '''
+        # look up attributes only once per response
+        client = self.__client
+        recv_into = client.recv_into
+        buf = self.__rxbuf
+        mv = self.__rxmv
+        size = 11 # sub header to end code
+        received = 0
+        while received < size:
+            n = recv_into(mv[received:size]) # don't read the next response
+            if n == 0:
+                # Length of responsed data is required over 11 bytes
+                # Note: One port uses only one device in FX5.
+                # (ConnectionResetError, because the PLC closed it. __send retries it)
+                raise ConnectionResetError('Connection error. It already may connect other device.' + str(received))
+            received += n
+            if received >= 9:
+                size = max(11, 9 + _unpack_u16(buf, 7)[0])
+                if buf[0] != 0xD0 or buf[1] != 0x00:
+                    raise _FramingError('Response is broken. ' + bytes(mv[:received]).hex())
+                if size > len(buf):
+                    raise _FramingError('Response is too large. ' + str(size))
+        if _TCP_QUICKACK is not None:
+            # the kernel may turn quick ACK off again, so set it after each recv
+            try:
+                client.setsockopt(socket.IPPROTO_TCP, _TCP_QUICKACK, 1)
+            except OSError:
+                pass # it is only for speed
+        return size
 
     def close(self):
         try:
@@ -115,6 +667,35 @@ class FX5:
             pass
 
     def is_open(self):
+        '''Check if connection is open (it doesn't connect).
+
+        It peeks the socket without waiting, so a connection closed by the PLC
+        is found without sending a request.
+        
+        Return:
+            bool: True of False
+        '''
+        if not self.__isopen:
+            return False
+        if not self.__lock.acquire(blocking=False):
+            return True # other thread is using the connection
+        try:
+            client = self.__client
+            client.settimeout(0)
+            try:
+                if client.recv(1, socket.MSG_PEEK) == b'':
+                    self.close() # closed by the PLC
+            except (BlockingIOError, InterruptedError):
+                pass # no data, but still connected
+            except OSError:
+                self.close()
+            if self.__isopen:
+                client.settimeout(2) # 秒
+        finally:
+            self.__lock.release()
+        return self.__isopen
+
+    def ensure_open(self):
         '''After calling '__open()' method, you can check if connection is open.
         
         Return:
@@ -137,32 +718,161 @@ class FX5:
         exp)
         D150=31,D200=5,D300=2,D160=1,D210=1,D310=1,M1501=1
 
+        'D' devices are written with write random frames (80 devices a frame),
+        and then 'M' devices (188 devices a frame). So 'M' devices are always
+        written after 'D' devices (exp: M1501 can be used as a trigger of D150).
+
         Args:
             cmd (str): device names and values
         '''
+        words = []
+        bits = []
         for dev_value in cmd.split(','):
             dev, value = dev_value.split('=')
-            self.write(dev, value)
+            dev_type = dev[0]
+            if dev_type == 'D':
+                words.append((int(dev[1:]), int(value)))
+            elif dev_type == 'M':
+                bits.append((int(dev[1:]), int(value)))
+            else:
+                raise Exception("Unsupported device type")
+        # 'M' frames are sent after all 'D' frames are written without errors
+        self.__send_many([_write_random_d_frame(words[i:i + _MAX_RANDOM_WORDS])
+                          for i in range(0, len(words), _MAX_RANDOM_WORDS)])
+        self.__send_many([_write_random_m_frame(bits[i:i + _MAX_RANDOM_BITS])
+                          for i in range(0, len(bits), _MAX_RANDOM_BITS)])
+
+    @staticmethod
+    def compile(devno):
+        '''Parse a device name once to read/write it many times.
+
+        exp)
+        m1600 = FX5.compile('M1600')
+        while True:
+            fx5.read(m1600)
+
+        Args:
+            devno (str): device name (exp: D500)
+
+        Return:
+            DevHandle: parsed device
+        '''
+        return _parse_devname(devno)
+
+    def read_cached(self, devno, ttl_ms, as_ascii=False):
+        '''Read a device, but return the last value while it is newer than ttl_ms.
+
+        Polling loops often read a device faster than it changes, so it skips
+        the request to the PLC. Note: a value written by write() is also not
+        seen until ttl_ms has passed.
+
+        Args:
+            devno (str or DevHandle): device name (exp: D500)
+            ttl_ms (int): how long the last value is used (milliseconds)
+            as_ascii (bool): you can use this argument when value is ASCII code.
+
+        Return:
+            bool, int, str or list: same as read()
+                (a list is a copy, so the caller can change it)
+        '''
+        now = time.monotonic()
+        key = (devno, as_ascii)
+        cache = self.__read_cache
+        cached = cache.get(key)
+        if cached is None or now - cached[0] >= ttl_ms / 1000:
+            if cached is not None:
+                cache.pop(key, None) # insert it again as the newest
+            elif len(cache) >= _MAX_READ_CACHE:
+                # dicts keep insertion order, so the first key is the least recently read
+                cache.pop(next(iter(cache)), None)
+            cached = cache[key] = (now, self.read(devno, as_ascii))
+        value = cached[1]
+        return list(value) if isinstance(value, list) else value
 
     def read(self, devno, as_ascii=False):
-        dev_type = devno[0]
-        dev_no = int(devno[1:])
-        if dev_type == 'M':
-            return self.__read_m(dev_no)
-        elif dev_type == 'D':
-            return self.__read_d(dev_no, as_ascii)
-        raise Exception("Unsupported device type")
+        if isinstance(devno, str):
+            if ':' in devno:
+                # exp) 'D500:10' reads 10 devices from D500
+                dev, count = devno.split(':')
+                return self.read_block(dev, int(count), as_ascii)
+            devno = _parse_devname(devno)
+        if devno.type == 'M':
+            return self.__send(devno._frame)[0] == 0x10
+        if as_ascii:
+            re = self.__send(devno._frame)
+            return self.to_string(re[0], re[1])
+        return self.__send(devno._frame, _I16.unpack_from)[0]
     
     def write(self, devno, value, as_ascii=False):
-        dev_type = devno[0]
-        dev_no = int(devno[1:])
-        if dev_type == 'M':
-            return self.__write_m(dev_no, int(value))
-        elif dev_type == 'D':
-            return self.__write_d(dev_no, value, as_ascii)
-        raise Exception("Unsupported device type")
+        if isinstance(devno, str):
+            devno = _parse_devname(devno)
+        if devno.type == 'M':
+            return self.write_bit(devno.no, int(value))
+        if as_ascii:
+            return self.write_string(devno.no, value)
+        return self.write_word(devno.no, value)
+
+    def read_block(self, devno, count, as_ascii=False):
+        '''Read consecutive devices with one frame.
+
+        Args:
+            devno (str): first device name (exp: D500)
+            count (int): number of devices
+            as_ascii (bool): you can use this argument when values are ASCII code.
+
+        Return:
+            list or str: values of devices (bool for 'M', int for 'D').
+                If you use as_ascii, it returns string.
+        '''
+        frame = _read_block_frame(devno, count)
+        return _decode_block(devno[0], self.__send(frame), count, as_ascii)
+
+    def write_block(self, devno, values):
+        '''Write consecutive devices with one frame.
+
+        Args:
+            devno (str): first device name (exp: D500)
+            values (list): values of devices (1 or 0 for 'M', int for 'D')
+        '''
+        self.__send(_write_block_frame(devno, values))
+        return
+
+    def read_d_block(self, start, count):
+        '''Read consecutive devices 'D' into a numpy array (numpy is required).
 
-    def __read_m(self, devno):
+        Args:
+            start (int): first device number
+            count (int): number of devices
+
+        Return:
+            numpy.ndarray: signed 16-bit values (dtype int16)
+        '''
+        np = _numpy()
+        frame = _read_block_frame('D' + str(start), count)
+        # copy out of the receive buffer directly into the array
+        return self.__send(frame, lambda re: np.frombuffer(re, dtype='<i2', count=count).astype(np.int16))
+
+    def read_m_block(self, start, count):
+        '''Read consecutive devices 'M' into a numpy array (numpy is required).
+
+        Args:
+            start (int): first device number
+            count (int): number of devices
+
+        Return:
+            numpy.ndarray: values of devices (dtype bool)
+        '''
+        np = _numpy()
+
+        def decode(re):
+            re = np.frombuffer(re, dtype=np.uint8)
+            bits = np.empty(re.size * 2, dtype=np.uint8)
+            bits[0::2] = re >> _BIT_SHIFTS[0] & 0x0f
+            bits[1::2] = re >> _BIT_SHIFTS[1] & 0x0f
+            return bits[:count] == 0x01 # a new array, not a view of the receive buffer
+        return self.__send(_read_block_frame('M' + str(start), count), decode)
+
+    def read_bit(self, devno):
         '''Read device 'M'
 
         Args:
@@ -171,122 +881,63 @@ class FX5:
         Return:
             bool: return boolean from a bit(1=True, 0=False).
         '''
-        msg = [
-            0x50, 0x00, # sub header（fixed FX5U）
-            0x00, # required network number（fixed FX5U）
-            0xFF, # required area code（fixed FX5U）
-            0xFF, 0x03, # required unit I/O number（fixed FX5U）
-            0x00, # required multi drop area code（fixed FX5U）
-            0x0C, 0x00, # required data length (byte size after reserved code)
-            0x00, 0x00, # reserved code
-            0x01, 0x04, # read command with bulk
-            0x01, 0x00, # sub command（bit unit）
-            devno & 0xff, # first device number（from lower byte）
-            devno>>8 & 0xff,
-            devno>>16 & 0xff,
-            0x90, # device code 90=M
-            0x01, 0x00 # device point（fixed 1）
-        ]
-        pack_msg = struct.pack('21B', *msg)
-        re = self.__send(pack_msg)
-        return format(re[0], '#04x') == '0x10'
-
-    def __write_m(self, devno, on):
+        return self.__send(_frame(_READ_M_TEMPLATE, devno))[0] == 0x10
+
+    def write_bit(self, devno, on):
         '''Write device 'M'.
 
         Args:
             devno (int): device number
             on (bool): return boolean from a bit(1=True, 0=False).
         '''
-        msg = [
-            0x50, 0x00,
-            0x00,
-            0xFF,
-            0xFF, 0x03,
-            0x00,
-            0x0D, 0x00,
-            0x00, 0x00,
-            0x01, 0x14, # write command with bulk
-            0x01, 0x00,
-            devno & 0xff,
-            devno>>8 & 0xff,
-            devno>>16 & 0xff,0x90, # device code 90=M
-            0x01, 0x00,
-            0x10 if on == True else 0x00 # write data
-        ]
-        pack_msg = struct.pack('22B', *msg)
-        self.__send(pack_msg)
+        self.__send(_write_bit_frame(devno, on))
         return
 
-    def __read_d(self, devno, as_ascii=False):
+    def read_word(self, devno):
         '''Read device 'D'
 
         Args:
             devno (int): device number
-            as_ascii (bool): you can use this argument when value is ASCII code.
         
         Return:
-            int or str: If you use as_ascii, it returns string.
+            int: signed 16-bit
         '''
-        msg = [
-            0x50, 0x00,
-            0x00,
-            0xFF,
-            0xFF, 0x03,
-            0x00,
-            0x0C, 0x00,
-            0x00, 0x00,
-            0x01, 0x04,
-            0x00, 0x00,
-            devno & 0xff,
-            devno>>8 & 0xff,
-            devno>>16 & 0xff,
-            0xA8, # device code A8=D
-            0x01, 0x00
-        ]
-        pack_msg = struct.pack('21B', *msg)
-        re = self.__send(pack_msg)
-        if as_ascii:
-            return self.to_string(re[0], re[1])
-        else:
-            return self.to_int16_signed(re[1], re[0])
+        return self.__send(_frame(_READ_D_TEMPLATE, devno), _I16.unpack_from)[0]
 
-    def __write_d(self, devno, data, as_ascii=False):
+    def write_word(self, devno, data):
         '''Write device 'D'.
 
         Args:
             devno (int): device number
-            data (int or str): value
-            as_ascii (bool): you can use this argument when value is ASCII code.
+            data (int): value (-32768 to 65535)
         '''
-        if as_ascii:
-            if len(data) > 2:
-                raise Exception("you can write only 2 words")
-            tuple_data = self.to_ascii(str(data)) # convert to (low, high)
-        else:
-            tuple_data = self.to_2bite_signed(int(data)) # convert to (low, high)
-        msg = [
-            0x50, 0x00,
-            0x00,
-            0xFF,
-            0xFF, 0x03,
-            0x00,
-            0x0E, 0x00,
-            0x00, 0x00,
-            0x01, 0x14,
-            0x00, 0x00,
-            devno & 0xff,
-            devno>>8 & 0xff,
-            devno>>16 & 0xff,
-            0xA8, # device code A8=D
-            0x01, 0x00,
-            tuple_data[0], tuple_data[1] # low, high
-        ]
-        pack_msg = struct.pack('23B', *msg)
-        self.__send(pack_msg)
+        self.__send(_write_word_frame(devno, data))
+        return
+
+    def read_string(self, devno):
+        '''Read device 'D' as ASCII code.
+
+        Args:
+            devno (int): device number
+        
+        Return:
+            str: two strings
+        '''
+        re = self.__send(_frame(_READ_D_TEMPLATE, devno))
+        return self.to_string(re[0], re[1])
+
+    def write_string(self, devno, data):
+        '''Write device 'D' as ASCII code.
+
+        Args:
+            devno (int): device number
+            data (str): strings (from 0 length to 2 length)
+        '''
+        self.__send(_write_string_frame(devno, data))
         return
     
-    def to_int16_signed(self, upper, lower):
+    @staticmethod
+    def to_int16_signed(upper, lower):
         '''convert 2-byte(8bit/hex) to unsigned 16-bit
         
         Args:
@@ -296,10 +947,11 @@ class FX5:
         Return:
             int：signed 16-bit
         '''
-        num = (upper<<8) + lower
-        return -(num & 0b1000000000000000) | (num & 0b0111111111111111)
+        # flip the sign bit and shift back (cheaper than struct for one value)
+        return ((upper<<8 | lower) ^ 0x8000) - 0x8000
 
-    def to_int16_unsigned(self, upper, lower):
+    @staticmethod
+    def to_int16_unsigned(upper, lower):
         '''convert 2-byte(8bit 16hex) to unsigned 16-bit
         
         Args:
@@ -309,9 +961,11 @@ class FX5:
         Return:
             int：signed 16-bit
         '''
-        return (upper<<8) + lower
+        return upper<<8 | lower
 
-    def to_string(self, upper, lower):
+    @staticmethod
+    @lru_cache(maxsize=1024) # same values are read/written again and again
+    def to_string(upper, lower):
         '''convert 2-byte(8bit/hex) to two strings
         
         Args:
@@ -321,9 +975,26 @@ class FX5:
         Return:
             string：two strings
         '''
-        return (chr(upper) if upper != 0 else '') + (chr(lower) if lower != 0 else '')
+        # 0 means no character (latin-1 decodes each byte like chr())
+        return bytes((upper, lower)).replace(b'\x00', b'').decode('latin-1')
     
-    def to_2bite_signed(self, num):
+    @staticmethod
+    def to_string_block(data):
+        '''convert bytes of some words (exp: block read) to strings at once.
+
+        Each word is converted like to_string().
+
+        Args:
+            data (bytes): bytes of words
+
+        Return:
+            string：strings
+        '''
+        # 0 means no character (latin-1 decodes each byte like chr())
+        return bytes(data).replace(b'\x00', b'').decode('latin-1')
+
+    @staticmethod
+    def to_2bite_signed(num):
         '''convert integer to signed 2-byte
 
         Args:
@@ -332,11 +1003,11 @@ class FX5:
         Return:
             tuple(int,int)：signed 2-byte（low, high)
         '''
-        import struct
-        pack = struct.pack('H', num) # H = unsigned short/integer/size:2
-        return struct.unpack('BB', pack) # B = unsigned char/integer/size:1
+        return (num & 0xff, num>>8 & 0xff)
 
-    def to_ascii(self, str_data):
+    @staticmethod
+    @lru_cache(maxsize=1024) # same values are read/written again and again
+    def to_ascii(str_data):
         '''convert strings(from 0 length to 2 length) to integer（tuple）.
 
         Args:
@@ -345,90 +1016,230 @@ class FX5:
         Return:
             tuple(int,int)：integer (lower, upper)
         '''
-        if len(str_data) == 2:
-            lower = ord(str_data[0])
-            upper = ord(str_data[1])
-        elif len(str_data) == 1:
-            lower = ord(str_data[0])
-            upper = 0
-        else:
-            lower = 0
-            upper = 0
-        return (lower, upper)
+        # missing characters are filled with 0
+        data = str_data.encode('latin-1')[:2].ljust(2, b'\x00')
+        return (data[0], data[1])
+
+    @classmethod
+    def error_message(cls, code):
+        '''Get the message of an end code.
+
+        Args:
+            code (int): end code (exp: 0xC059)
+
+        Return:
+            str: error message
+        '''
+        return cls.__error.get(code, "unknown error")
 
     # quote FX5 manual in Mitsubishi site
     # (I translated into English by using Google translation
     #  So don't ask me detailed meaning of errors..., sorry.)
     __error = {
         0x1920: 'The value of the IP address setting (SD8492 to SD8497) is out of the setting range. ',
-        0x1921: 'The write request and the clear request (SM8492, SM8495) were turned off and on at the same time. ',
-        0x112E: 'Connection not established during open processing. ',
-        0x1134: 'A TCP ULP timeout error occurred during TCP / IP communication (ACK was not returned from the partner device). ',
-        0x2160: 'A duplicate IP address has been detected. ',
-        0x2250: 'The protocol setting data stored in the CPU unit is not a usable unit. ',
-        0xC012: 'Open processing with the partner device failed. (For TCP / IP) ',
-        0xC013: 'The open processing with the partner device failed. (For UDP / IP) ',
-        0xC015: 'There is an error in the setting value of the IP address of the external device during open processing, or the setting of the IP address of the external device in the dedicated command. ',
-        0xC018: 'The setting of the IP address of the partner device is incorrect. ',
-        0xC020: 'The transmission / reception data length exceeds the allowable range. ',
-        0xC024: 'Communication using communication protocol was performed in connection other than communication protocol. ',
-        0xC025: 'The content of the control data is incorrect or the open setting parameter has not been set, but the open setting parameter was specified. ',
-        0xC027: 'Message transmission of socket communication failed. ',
-        0xC029: 'The content of the control data is incorrect, or the open setting parameter was specified as open without setting. ',
-        0xC035: 'The existence of the partner device could not be confirmed within the response monitoring timer value. ',
-        0xC0B6: 'The channel specified by the dedicated instruction is out of range. ',
-        0xC0DE: 'Failed to receive message for socket communication. ',
-        0xC1A2: 'Response to request could not be received. ',
-        0xC1AC: 'The number of retransmissions is incorrect. ',
-        0xC1AD: 'The data length is incorrectly specified. ',
-        0xC1AF: 'The port number is incorrectly specified. ',
-        0xC1B0: 'The specified connection has already been opened. ',
-        0xC1B1: 'The specified connection has not completed open processing. ',
-        0xC1B3: 'Another transmission / reception command is being executed on the specified channel. ',
-        0xC1B4: 'The arrival time specification is incorrect. ',
-        0xC1BA: 'The dedicated instruction was executed in the initial uncompleted state. ',
-        0xC1C6: 'There is an error in the setting of the execution type of the dedicated instruction and the completion type when an error occurs. ',
-        0xC1CC: 'Response with a data length exceeding the allowable range in SLMPSND was received, or the request data was specified incorrectly. ',
-        0xC1CD: 'Failed to send message of SLMPSND command. ',
-        0xC1D0: 'The request destination module I / O number of the dedicated instruction is incorrect. ',
-        0xC1D3: 'A dedicated command not supported by the connection communication method was executed. ',
-        0xC400: 'The SP.ECPRTCL instruction was executed when communication protocol preparation was not completed (SD10692 = 0). ',
-        0xC401: 'Specified a protocol number that is not registered in the CPU unit with the control data of the SP.ECPRTCL instruction, or executed the SP.ECPRTCL instruction without writing the protocol setting data. ',
-        0xC404: 'The SP.ECPRTCL instruction was abnormally completed while accepting a cancel request during protocol execution. ',
-        0xC405: 'In the control data of the SP.ECPRTCL instruction, the set value of the protocol number is out of range. ',
-        0xC410: 'Reception waiting time has timed out. ',
-        0xC411: 'The received data has exceeded 2046 bytes. ',
-        0xC417: 'The data length of received data or the number of data is out of range. ',
-        0xC431: 'Connection closed during execution of the SP.ECPRTCL instruction. ',
-        0xCEE0: 'Detected from another peripheral device or executed another iQSS function during automatic detection of connected device. ',
-        0xCEE1: 'An abnormal frame was received. ',
-        0xCEE2: 'An abnormal frame was received. ',
-        0xCF10: 'An abnormal frame was received. ',
-        0xCF20: 'The communication setting value is out of range, or a communication setting item that cannot be set for the target device has been set, or an item that must be set for the target device has not been set. ',
-        0xCF30: 'Parameter not supported by target device was specified. ',
-        0xCF31: 'An abnormal frame was received. ',
-        0xCF70: 'An error has occurred in the Ethernet communication path. ',
-        0xCF71: 'A timeout error has occurred. ',
-        0xC050: 'When communication data code is set to ASCII, ASCII code data that cannot be converted to binary was received. ',
-        0xC051: 'The maximum number of bit devices that can be read / written at once at one time is out of the allowable range. ',
-        0xC052: 'The maximum number of word devices that can be read / written at once at one time is out of the allowable range. ',
-        0xC053: 'The maximum number of bit devices that can be randomly read and written at one time is out of the allowable range. ',
-        0xC054: 'The maximum number of word devices that can be read / written at random at one time is out of the allowable range. ',
-        0xC056: 'Write and read request exceeding the maximum address. ',
-        0xC058: 'The required data length after ASCII-binary conversion does not match the number of data in the character part (part of text). ',
-        0xC059: 'The command or subcommand specification is incorrect. Commands and subcommands that cannot be used in the CPU unit. ',
-        0xC05B: 'The CPU unit cannot write to or read from the specified device. ',
-        0xC05C: 'The request content is incorrect. (Such as bit-wise writing and reading for word devices) ',
-        0xC05F: 'The request cannot be executed for the target CPU module',
-        0xC060: 'The request content is incorrect. (Such as an incorrect data specification for a bit device) ',
-        0xC061: 'The requested data length does not match the number of data in the character part (part of text). ',
-        0xC06F: 'ASCII request message was received when the communication data code was set to "binary." (For this error code, only the error history is registered and no abnormal response is returned.) ',
-        0xC0D8: 'The specified number of blocks is out of range',
-        0xC200: 'The remote password is incorrect',
-        0xC201: 'The port used for communication is locked with the remote password',
-        0xC204: 'Different from the partner device that requested unlock processing of the remote password. ',
-        0xC810: 'The remote password is incorrect. (Authentication failed 9 times or less) ',
-        0xC815: 'The remote password is incorrect. (Authentication failed 10 times) ',
-        0xC816: 'Remote password authentication lockout in progress. '
+        0x1921: 'The write request and the clear request (SM8492, SM8495) were turned off and on at the same time. ',
+        0x112E: 'Connection not established during open processing. ',
+        0x1134: 'A TCP ULP timeout error occurred during TCP / IP communication (ACK was not returned from the partner device). ',
+        0x2160: 'A duplicate IP address has been detected. ',
+        0x2250: 'The protocol setting data stored in the CPU unit is not a usable unit. ',
+        0xC012: 'Open processing with the partner device failed. (For TCP / IP) ',
+        0xC013: 'The open processing with the partner device failed. (For UDP / IP) ',
+        0xC015: 'There is an error in the setting value of the IP address of the external device during open processing, or the setting of the IP address of the external device in the dedicated command. ',
+        0xC018: 'The setting of the IP address of the partner device is incorrect. ',
+        0xC020: 'The transmission / reception data length exceeds the allowable range. ',
+        0xC024: 'Communication using communication protocol was performed in connection other than communication protocol. ',
+        0xC025: 'The content of the control data is incorrect or the open setting parameter has not been set, but the open setting parameter was specified. ',
+        0xC027: 'Message transmission of socket communication failed. ',
+        0xC029: 'The content of the control data is incorrect, or the open setting parameter was specified as open without setting. ',
+        0xC035: 'The existence of the partner device could not be confirmed within the response monitoring timer value. ',
+        0xC0B6: 'The channel specified by the dedicated instruction is out of range. ',
+        0xC0DE: 'Failed to receive message for socket communication. ',
+        0xC1A2: 'Response to request could not be received. ',
+        0xC1AC: 'The number of retransmissions is incorrect. ',
+        0xC1AD: 'The data length is incorrectly specified. ',
+        0xC1AF: 'The port number is incorrectly specified. ',
+        0xC1B0: 'The specified connection has already been opened. ',
+        0xC1B1: 'The specified connection has not completed open processing. ',
+        0xC1B3: 'Another transmission / reception command is being executed on the specified channel. ',
+        0xC1B4: 'The arrival time specification is incorrect. ',
+        0xC1BA: 'The dedicated instruction was executed in the initial uncompleted state. ',
+        0xC1C6: 'There is an error in the setting of the execution type of the dedicated instruction and the completion type when an error occurs. ',
+        0xC1CC: 'Response with a data length exceeding the allowable range in SLMPSND was received, or the request data was specified incorrectly. ',
+        0xC1CD: 'Failed to send message of SLMPSND command. ',
+        0xC1D0: 'The request destination module I / O number of the dedicated instruction is incorrect. ',
+        0xC1D3: 'A dedicated command not supported by the connection communication method was executed. ',
+        0xC400: 'The SP.ECPRTCL instruction was executed when communication protocol preparation was not completed (SD10692 = 0). ',
+        0xC401: 'Specified a protocol number that is not registered in the CPU unit with the control data of the SP.ECPRTCL instruction, or executed the SP.ECPRTCL instruction without writing the protocol setting data. ',
+        0xC404: 'The SP.ECPRTCL instruction was abnormally completed while accepting a cancel request during protocol execution. ',
+        0xC405: 'In the control data of the SP.ECPRTCL instruction, the set value of the protocol number is out of range. ',
+        0xC410: 'Reception waiting time has timed out. ',
+        0xC411: 'The received data has exceeded 2046 bytes. ',
+        0xC417: 'The data length of received data or the number of data is out of range. ',
+        0xC431: 'Connection closed during execution of the SP.ECPRTCL instruction. ',
+        0xCEE0: 'Detected from another peripheral device or executed another iQSS function during automatic detection of connected device. ',
+        0xCEE1: 'An abnormal frame was received. ',
+        0xCEE2: 'An abnormal frame was received. ',
+        0xCF10: 'An abnormal frame was received. ',
+        0xCF20: 'The communication setting value is out of range, or a communication setting item that cannot be set for the target device has been set, or an item that must be set for the target device has not been set. ',
+        0xCF30: 'Parameter not supported by target device was specified. ',
+        0xCF31: 'An abnormal frame was received. ',
+        0xCF70: 'An error has occurred in the Ethernet communication path. ',
+        0xCF71: 'A timeout error has occurred. ',
+        0xC050: 'When communication data code is set to ASCII, ASCII code data that cannot be converted to binary was received. ',
+        0xC051: 'The maximum number of bit devices that can be read / written at once at one time is out of the allowable range. ',
+        0xC052: 'The maximum number of word devices that can be read / written at once at one time is out of the allowable range. ',
+        0xC053: 'The maximum number of bit devices that can be randomly read and written at one time is out of the allowable range. ',
+        0xC054: 'The maximum number of word devices that can be read / written at random at one time is out of the allowable range. ',
+        0xC056: 'Write and read request exceeding the maximum address. ',
+        0xC058: 'The required data length after ASCII-binary conversion does not match the number of data in the character part (part of text). ',
+        0xC059: 'The command or subcommand specification is incorrect. Commands and subcommands that cannot be used in the CPU unit. ',
+        0xC05B: 'The CPU unit cannot write to or read from the specified device. ',
+        0xC05C: 'The request content is incorrect. (Such as bit-wise writing and reading for word devices) ',
+        0xC05F: 'The request cannot be executed for the target CPU module',
+        0xC060: 'The request content is incorrect. (Such as an incorrect data specification for a bit device) ',
+        0xC061: 'The requested data length does not match the number of data in the character part (part of text). ',
+        0xC06F: 'ASCII request message was received when the communication data code was set to "binary." (For this error code, only the error history is registered and no abnormal response is returned.) ',
+        0xC0D8: 'The specified number of blocks is out of range',
+        0xC200: 'The remote password is incorrect',
+        0xC201: 'The port used for communication is locked with the remote password',
+        0xC204: 'Different from the partner device that requested unlock processing of the remote password. ',
+        0xC810: 'The remote password is incorrect. (Authentication failed 9 times or less) ',
+        0xC815: 'The remote password is incorrect. (Authentication failed 10 times) ',
+        0xC816: 'Remote password authentication lockout in progress. '
         #0x4000H～4FFF : 'CPU unit finds errors.（exclude connection SLMP'
-        }
\ No newline at end of file
+        }
+
+
+'''
+Example
+    fx5 = AsyncFX5('192.168.1.10:2555')
+    await fx5.write('D500', 30)
+    print(await fx5.read('D500')) # -> 30
+    await fx5.close()
+'''
+class AsyncFX5:
+    '''asyncio version of FX5.
+
+    A coroutine waiting for the PLC doesn't block a thread, so one event loop
+    can poll many PLCs at the same time.
+    '''
+
+    '''
+    Args:
+        host (str): IP address:Port number
+    '''
+    def __init__(self, host):
+        self.__ip, self.__port = host.split(':')
+        self.__reader = None
+        self.__writer = None
+        # asyncio is imported when it is used, so FX5 users don't pay for it
+        import asyncio
+        self.__asyncio = asyncio
+        self.__lock = asyncio.Lock()
+
+    def __str__(self):
+        return self.__ip + ":" + self.__port + " " + ("Open" if self.is_open() else "Close")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def __open(self):
+        '''Connect to NC'''
+        if self.__writer is None:
+            self.__reader, self.__writer = await self.__asyncio.open_connection(self.__ip, int(self.__port))
+            sock = self.__writer.get_extra_info('socket')
+            if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+                # SLMP is small request/response, so don't wait for Nagle and delayed ACK
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def __exchange(self, data):
+        '''Send a request and receive one response frame.'''
+        await self.__open()
+        self.__writer.write(data)
+        await self.__writer.drain()
+        header = await self.__reader.readexactly(11) # sub header to end code
+        if header[0] != 0xD0 or header[1] != 0x00:
+            raise _FramingError('Response is broken. ' + header.hex())
+        body = await self.__reader.readexactly(max(0, _unpack_u16(header, 7)[0] - 2))
+        return header, body
+
+    async def __send(self, data):
+        '''Send instruction words to PLC.
+
+        When some errors occur, it will throw error codes with hexadecimal.
+
+        Args:
+            data (bytearray): data sentence
+
+        Return:
+            bytes: responsed data without end code
+        '''
+        async with self.__lock:
+            try:
+                header, body = await self.__asyncio.wait_for(self.__exchange(data), 2) # 秒
+            except BaseException as e:
+                # Cancelled after the request was sent, the response is still
+                # in the stream, so drop the connection not to read it next time.
+                await self.close()
+                raise e
+        # End code (offset 9-10) is not 0 when the PLC returns an error
+        code = _unpack_u16(header, 9)[0]
+        if code:
+            raise _end_code_error(code)
+        return body
+
+    async def close(self):
+        writer = self.__writer
+        self.__reader = None
+        self.__writer = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except:
+                pass
+
+    def is_open(self):
+        '''Check if connection is open (it doesn't connect).
+
+        Return:
+            bool: True of False
+        '''
+        return self.__writer is not None
+
+    async def read(self, devno, as_ascii=False):
+        if isinstance(devno, str):
+            if ':' in devno:
+                # exp) 'D500:10' reads 10 devices from D500
+                dev, count = devno.split(':')
+                return await self.read_block(dev, int(count), as_ascii)
+            devno = _parse_devname(devno)
+        re = await self.__send(devno._frame)
+        if devno.type == 'M':
+            return re[0] == 0x10
+        return FX5.to_string(re[0], re[1]) if as_ascii else _I16.unpack_from(re)[0]
+
+    async def write(self, devno, value, as_ascii=False):
+        if isinstance(devno, str):
+            devno = _parse_devname(devno)
+        if devno.type == 'M':
+            buf = _write_bit_frame(devno.no, int(value))
+        elif as_ascii:
+            buf = _write_string_frame(devno.no, value)
+        else:
+            buf = _write_word_frame(devno.no, value)
+        await self.__send(buf)
+        return
+
+    async def read_block(self, devno, count, as_ascii=False):
+        '''Read consecutive devices with one frame. (see FX5.read_block)'''
+        re = await self.__send(_read_block_frame(devno, count))
+        return _decode_block(devno[0], re, count, as_ascii)
+
+    async def write_block(self, devno, values):
+        '''Write consecutive devices with one frame. (see FX5.write_block)'''
+        await self.__send(_write_block_frame(devno, values))
+        return
@@ -2,20 +2,33 @@
 '''
 本テストは三菱FX5シーケンサのテストスクリプトです。
 '''
+import asyncio
+import errno
 import os
+import socket
+import struct
 import sys
+import threading
 import unittest
 
-from fx5 import FX5
+import fx5
+from fx5 import FX5, AsyncFX5
 
 
 class TestFX5(unittest.TestCase):
+    '''実機を使った結合テスト。
+
+    環境変数 FX5_TEST_HOST（例: 192.168.32.218:2556）を指定した場合のみ実行する。
+    '''
 
     @classmethod
     def setUpClass(cls):
         '''テストクラスが初期化される際に一度だけ呼ばれる。'''
+        host = os.environ.get('FX5_TEST_HOST')
+        if not host:
+            raise unittest.SkipTest('環境変数 FX5_TEST_HOST が指定されていません。')
         print('----- TestFX5 start ------')
-        cls.fx5 = FX5.get_connection("192.168.32.218:2556")
+        cls.fx5 = FX5.get_connection(host)
 
     @classmethod
     def tearDownClass(cls):
@@ -25,7 +38,7 @@ class TestFX5(unittest.TestCase):
 
     def setUp(self):
         '''テストごとに開始前に必ず実行'''
-        if not self.fx5.is_open():
+        if not self.fx5.ensure_open():
             self.skipTest('指定されたIPに接続できません。電源が入っていない可能性があります。')
 
     def test_to_int16_signed(self):
@@ -69,6 +82,13 @@ class TestFX5(unittest.TestCase):
         # 0x3839 = 89
         self.assertEqual(self.fx5.to_string(0x38, 0x39), '89')
 
+    def test_to_string_block(self):
+        '''複数ワードのバイト列を、ASCIIコードとして解釈し、文字列に変換するテスト。'''
+        self.assertEqual(self.fx5.to_string_block(b'ABCD'), 'ABCD')
+        self.assertEqual(self.fx5.to_string_block(b'AB\x00\x00'), 'AB')
+        self.assertEqual(self.fx5.to_string_block(b'A\x00C\x00'), 'AC')
+        self.assertEqual(self.fx5.to_string_block(b''), '')
+
     def test_to_2bite_signed(self):
         '''整数を、符号付き2バイト（tuple）に変換するテスト。'''
         self.assertEqual(self.fx5.to_2bite_signed(0), (0,0))
@@ -102,6 +122,75 @@ class TestFX5(unittest.TestCase):
         self.assertEqual(self.fx5.read('D500'), 3000)
         self.fx5.write('D500', 30000)
         self.assertEqual(self.fx5.read('D500'), 30000)
+        self.fx5.write('D500', 65535) # 符号なしでも書き込める
+        self.assertEqual(self.fx5.read('D500'), -1)
+
+    def test_d_dev_out_of_range(self):
+        '''16ビットに収まらない値を書き込んだ場合のテスト。'''
+        self.fx5.write('D500', 30)
+        for value in (65536, -32769):
+            with self.assertRaisesRegex(Exception, 'Out of range'):
+                self.fx5.write('D500', value)
+            with self.assertRaisesRegex(Exception, 'Out of range'):
+                self.fx5.write_block('D500', [1, value])
+            with self.assertRaisesRegex(Exception, 'Out of range'):
+                self.fx5.exec_cmd('D500=%d' % value)
+        self.assertEqual(self.fx5.read('D500'), 30)
+
+    def test_direct_operation(self):
+        '''デバイス種別ごとの読み書きテスト。'''
+        self.fx5.write_bit(1600, 1)
+        self.assertEqual(self.fx5.read_bit(1600), True)
+        self.fx5.write_word(500, -30)
+        self.assertEqual(self.fx5.read_word(500), -30)
+        self.fx5.write_string(500, 'AB')
+        self.assertEqual(self.fx5.read_string(500), 'AB')
+
+    def test_compile(self):
+        '''解析済みデバイスでの読み書きテスト。'''
+        d500 = FX5.compile('D500')
+        self.assertEqual((d500.type, d500.no), ('D', 500))
+        self.fx5.write(d500, 30)
+        self.assertEqual(self.fx5.read(d500), 30)
+        m1600 = FX5.compile('M1600')
+        self.fx5.write(m1600, 1)
+        self.assertEqual(self.fx5.read(m1600), 1)
+        # 解析済みデバイスは共有されるため変更できない
+        with self.assertRaises(AttributeError):
+            d500.no = 600
+        self.assertEqual(FX5.compile('D500').no, 500)
+
+    def test_read_cached(self):
+        '''有効期限付きの読み込みテスト。'''
+        self.fx5.write('D500', 30)
+        self.assertEqual(self.fx5.read_cached('D500', 1000), 30)
+        self.fx5.write('D500', 31)
+        # 有効期限内は前回の値を返す
+        self.assertEqual(self.fx5.read_cached('D500', 1000), 30)
+        self.assertEqual(self.fx5.read_cached('D500', 0), 31)
+        # 連続したデバイスはコピーを返す
+        values = self.fx5.read_cached('D500:2', 1000)
+        values.append(0)
+        self.assertEqual(len(self.fx5.read_cached('D500:2', 1000)), 2)
+
+    def test_block_operation(self):
+        '''連続したデバイスの一括読み書きテスト。'''
+        self.fx5.write_block('D500', [30, -1, 3000])
+        self.assertEqual(self.fx5.read_block('D500', 3), [30, -1, 3000])
+        self.assertEqual(self.fx5.read('D500:3'), [30, -1, 3000])
+        self.fx5.write_block('M1600', [1, 0, 1])
+        self.assertEqual(self.fx5.read_block('M1600', 3), [True, False, True])
+
+    def test_numpy_block(self):
+        '''連続したデバイスをnumpy配列として読み込むテスト。'''
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpyがインストールされていません。')
+        self.fx5.write_block('D500', [30, -1, 3000])
+        self.assertEqual(self.fx5.read_d_block(500, 3).tolist(), [30, -1, 3000])
+        self.fx5.write_block('M1600', [1, 0, 1])
+        self.assertEqual(self.fx5.read_m_block(1600, 3).tolist(), [True, False, True])
 
     def test_exec_cmd(self):
         '''デバイスの一括書き込みテスト。'''
@@ -109,5 +198,323 @@ class TestFX5(unittest.TestCase):
         self.assertEqual(self.fx5.read('M1600'), 1)
         self.assertEqual(self.fx5.read('D500'), 30)
 
+class FakePLC(threading.Thread):
+    '''SLMP（バイナリ, 3Eフレーム）に応答する疑似シーケンサ。
+
+    一括読み込み・一括書き込み・ランダム書き込みのみ対応する。
+    デバイスの値は全接続で共有する。
+    '''
+
+    # (デバイスコード, デバイス番号): 値
+    devices = {}
+    # threading.Event を設定すると、セットされるまで応答を止める
+    hold = None
+    # False にすると、続けて送られたリクエストを捨てる（最初の1つだけ応答する）
+    pipelining = True
+
+    def __init__(self, sock):
+        super().__init__(daemon=True)
+        self.sock = sock
+
+    def recv_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def run(self):
+        try:
+            while True:
+                header = self.recv_exactly(9)
+                body = self.recv_exactly(struct.unpack_from('<H', header, 7)[0])
+                hold = self.hold
+                if hold is not None:
+                    hold.wait()
+                if not self.pipelining:
+                    # 応答前に届いている次のリクエストを捨てる
+                    try:
+                        self.sock.recv(65536, socket.MSG_DONTWAIT)
+                    except BlockingIOError:
+                        pass
+                code, data = self.execute(body)
+                self.sock.sendall(bytes([0xD0, 0x00, 0x00, 0xFF, 0xFF, 0x03, 0x00])
+                                  + struct.pack('<HH', len(data) + 2, code) + data)
+        except (EOFError, OSError):
+            self.sock.close()
+
+    def execute(self, body):
+        '''リクエストを実行し、(終了コード, 応答データ)を返す。'''
+        command, sub = struct.unpack_from('<HH', body, 2)
+        devs = self.devices
+        if command in (0x0401, 0x1401): # 一括読み込み, 一括書き込み
+            no = int.from_bytes(body[6:9], 'little')
+            dev = body[9]
+            count = struct.unpack_from('<H', body, 10)[0]
+            if dev == 0xA8 and no + count > 8000:
+                return 0xC056, b'' # 最大アドレスを超えた
+            if command == 0x0401 and sub == 0x0001:
+                bits = [devs.get((dev, no + i), 0) for i in range(count)] + [0]
+                return 0, bytes(bits[i] << 4 | bits[i + 1] for i in range(0, count, 2))
+            if command == 0x0401:
+                return 0, b''.join(struct.pack('<H', devs.get((dev, no + i), 0)) for i in range(count))
+            data = body[12:]
+            for i in range(count):
+                if sub == 0x0001:
+                    devs[(dev, no + i)] = data[i >> 1] >> (0 if i & 1 else 4) & 0x0F
+                else:
+                    devs[(dev, no + i)] = struct.unpack_from('<H', data, i * 2)[0]
+            return 0, b''
+        if command == 0x1402: # ランダム書き込み
+            if sub == 0x0001:
+                for i in range(body[6]):
+                    entry = body[7 + i * 5:12 + i * 5]
+                    devs[(entry[3], int.from_bytes(entry[:3], 'little'))] = entry[4]
+            else:
+                entries = [body[8 + i * 6:14 + i * 6] for i in range(body[6])]
+                if any(entry[3] == 0xA8 and int.from_bytes(entry[:3], 'little') >= 8000 for entry in entries):
+                    return 0xC056, b'' # 最大アドレスを超えた
+                for entry in entries:
+                    devs[(entry[3], int.from_bytes(entry[:3], 'little'))] = struct.unpack_from('<H', entry, 4)[0]
+            return 0, b''
+        return 0xC059, b'' # 未対応のコマンド
+
+
+def fake_open(self):
+    '''FX5.__open の代わりに、疑似シーケンサとソケットペアで接続する。'''
+    if not self._FX5__isopen:
+        client, server = socket.socketpair()
+        client.settimeout(2) # 秒
+        FakePLC(server).start()
+        self._fake_server = server # シーケンサ側から切断するテスト用
+        self._FX5__client = client
+        self._FX5__isopen = True
+
+
+class TestFX5Fake(TestFX5):
+    '''疑似シーケンサを使ったテスト。実機が無くても実行できる。'''
+
+    @classmethod
+    def setUpClass(cls):
+        '''テストクラスが初期化される際に一度だけ呼ばれる。'''
+        cls.open = FX5._FX5__open
+        FX5._FX5__open = fake_open
+        cls.fx5 = FX5('fake:5000')
+
+    @classmethod
+    def tearDownClass(cls):
+        '''テストクラスが解放される際に一度だけ呼ばれる。'''
+        cls.fx5.close()
+        FX5._FX5__open = cls.open
+
+    def test_error_code(self):
+        '''シーケンサがエラーを返した場合のテスト。'''
+        with self.assertRaisesRegex(Exception, '0xC056'):
+            self.fx5.read('D8000')
+        # エラー後も同じ接続で続けて通信できる
+        self.fx5.write('D500', 30)
+        self.assertEqual(self.fx5.read('D500'), 30)
+
+    def test_reconnect(self):
+        '''シーケンサから切断された場合のテスト。'''
+        self.fx5.write('D500', 30)
+        self.fx5._FX5__client.shutdown(socket.SHUT_RDWR)
+        self.assertFalse(self.fx5.is_open())
+        self.assertEqual(self.fx5.read('D500'), 30)
+        self.assertTrue(self.fx5.is_open())
+
+    def test_reconnect_without_check(self):
+        '''is_open() で確認せずに、シーケンサから切断された接続を使う場合のテスト。'''
+        self.fx5.write('D500', 40)
+        self.fx5._fake_server.shutdown(socket.SHUT_WR) # シーケンサ側からFINを送る
+        self.assertEqual(self.fx5.read('D500'), 40)
+        self.assertTrue(self.fx5.is_open())
+
+    def test_get_connection_alias(self):
+        '''同じシーケンサを別の表記で指定した場合のテスト。'''
+        con = FX5.get_connection('127.0.0.1:5001')
+        self.assertIs(FX5.get_connection('127.0.0.01:5001'), con)
+        self.assertIs(FX5.get_connection('127.0.0.1:5001'), con)
+        self.assertIsNot(FX5.get_connection('127.0.0.1:5002'), con)
+
+    def test_borrow(self):
+        '''接続プールから接続を借りるテスト。'''
+        with self.assertRaisesRegex(Exception, 'maxsize'):
+            with FX5.borrow('127.0.0.1:5010', maxsize=0):
+                pass
+        options = [(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)]
+        with FX5.borrow('127.0.0.1:5010', maxsize=2, socket_options=options) as a:
+            with FX5.borrow('127.0.0.1:5010') as b:
+                self.assertIsNot(a, b) # スレッドごとに別の接続を使える
+                a.write('D500', 30)
+                self.assertEqual(b.read('D500'), 30)
+        self.assertEqual(a._FX5__socket_options, tuple(options))
+        # 同じシーケンサを別の表記で指定しても同じプールを使う
+        with FX5.borrow('127.0.0.01:5010') as c:
+            self.assertIs(c, a) # 返却された接続を再利用する
+        with self.assertRaisesRegex(Exception, 'already'):
+            with FX5.borrow('127.0.0.1:5010', maxsize=3):
+                pass
+        a.close()
+        b.close()
+        # 1ポートに1台しか接続できないため、既定では1接続
+        with FX5.borrow('127.0.0.1:5011') as d:
+            pass
+        with FX5.borrow('127.0.0.1:5011', maxsize=1) as e:
+            self.assertIs(e, d)
+
+    def test_read_cached_eviction(self):
+        '''読み込み値の保存数が上限を超えた場合のテスト。'''
+        cache = self.fx5._FX5__read_cache
+        cache.clear()
+        max_cache = fx5._MAX_READ_CACHE
+        fx5._MAX_READ_CACHE = 2
+        try:
+            self.fx5.read_cached('D500', 1000)
+            self.fx5.read_cached('D501', 1000)
+            self.fx5.read_cached('D500', 0) # 期限切れで読み直す
+            self.fx5.read_cached('D502', 1000)
+        finally:
+            fx5._MAX_READ_CACHE = max_cache
+        # 最も長く読まれていないデバイスが捨てられる
+        self.assertEqual(list(cache), [('D500', False), ('D502', False)])
+
+    def test_reconnect_after_keepalive(self):
+        '''キープアライブで切断が検出された接続を使う場合のテスト。'''
+        self.fx5.write('D500', 50)
+
+        class DeadSocket:
+            '''送信時にキープアライブのタイムアウト（ETIMEDOUT）を返すソケット。'''
+            def sendall(self, data):
+                raise TimeoutError(errno.ETIMEDOUT, 'Connection timed out')
+            def close(self):
+                pass
+
+        self.fx5._FX5__client.close()
+        self.fx5._FX5__client = DeadSocket()
+        self.assertEqual(self.fx5.read('D500'), 50)
+        self.fx5._FX5__client = DeadSocket()
+        self.fx5.exec_cmd('D500=51')
+        self.assertEqual(self.fx5.read('D500'), 51)
+
+    def test_exec_cmd_many(self):
+        '''複数フレームに分かれる一括書き込みのテスト。'''
+        self.fx5.exec_cmd(','.join('D%d=%d' % (500 + i, i) for i in range(200)))
+        self.assertEqual(self.fx5.read('D500:200'), list(range(200)))
+        # 途中のフレームでエラーが返された場合
+        cmd = ','.join('D%d=%d' % (500 + i, -i) for i in range(100)) + ',D8000=1'
+        with self.assertRaisesRegex(Exception, '0xC056'):
+            self.fx5.exec_cmd(cmd)
+        self.assertEqual(self.fx5.read('D500:80'), [-i for i in range(80)])
+        # 終了コードのエラーでは1フレームずつの送信に戻さない
+        self.assertEqual(self.fx5._FX5__window, 4)
+        self.assertEqual(self.fx5.read('D500'), 0)
+
+    def test_exec_cmd_timeout(self):
+        '''一括書き込みの応答が遅れた場合のテスト。'''
+        self.fx5.read('D500') # 接続する
+        self.fx5._FX5__client.settimeout(0.1) # 秒
+        FakePLC.hold = hold = threading.Event()
+        try:
+            with self.assertRaises(socket.timeout):
+                self.fx5.exec_cmd('D500=1')
+        finally:
+            FakePLC.hold = None
+            hold.set()
+        # 応答が遅いだけでは1フレームずつの送信に戻さない
+        self.assertEqual(self.fx5._FX5__window, 4)
+
+    def test_exec_cmd_no_pipelining(self):
+        '''続けて送ったリクエストにシーケンサが応答しない場合のテスト。'''
+        self.fx5.read('D500') # 接続する
+        self.fx5._FX5__client.settimeout(0.1) # 秒
+        FakePLC.pipelining = False
+        try:
+            self.fx5.exec_cmd(','.join('D%d=%d' % (500 + i, i + 1) for i in range(200)))
+            self.assertEqual(self.fx5._FX5__window, 1)
+        finally:
+            FakePLC.pipelining = True
+            self.fx5._FX5__window = 4
+        self.assertEqual(self.fx5.read('D500:200'), list(range(1, 201)))
+
+
+
+async def fake_async_open(self):
+    '''AsyncFX5.__open の代わりに、疑似シーケンサとソケットペアで接続する。'''
+    if self._AsyncFX5__writer is None:
+        client, server = socket.socketpair()
+        FakePLC(server).start()
+        self._AsyncFX5__reader, self._AsyncFX5__writer = await asyncio.open_connection(sock=client)
+
+
+class TestAsyncFX5Fake(unittest.TestCase):
+    '''疑似シーケンサを使ったAsyncFX5のテスト。'''
+
+    @classmethod
+    def setUpClass(cls):
+        '''テストクラスが初期化される際に一度だけ呼ばれる。'''
+        cls.open = AsyncFX5._AsyncFX5__open
+        AsyncFX5._AsyncFX5__open = fake_async_open
+
+    @classmethod
+    def tearDownClass(cls):
+        '''テストクラスが解放される際に一度だけ呼ばれる。'''
+        AsyncFX5._AsyncFX5__open = cls.open
+
+    def run_async(self, coro):
+        '''新しいAsyncFX5でコルーチンを実行する。'''
+        async def main():
+            async with AsyncFX5('fake:5000') as fx5:
+                return await coro(fx5)
+        return asyncio.run(main())
+
+    def test_operation(self):
+        '''デバイスの読み書きテスト。'''
+        async def main(fx5):
+            await fx5.write('M1600', 1)
+            await fx5.write('D500', -30)
+            await fx5.write('D501', 'AB', as_ascii=True)
+            return (await fx5.read('M1600'), await fx5.read('D500'),
+                    await fx5.read('D501', as_ascii=True), fx5.is_open())
+        self.assertEqual(self.run_async(main), (True, -30, 'AB', True))
+
+    def test_block_operation(self):
+        '''連続したデバイスの読み書きテスト。'''
+        async def main(fx5):
+            await fx5.write_block('D500', [30, -1, 3000])
+            await fx5.write_block('M1600', [1, 0, 1])
+            return await fx5.read('D500:3'), await fx5.read('M1600:3')
+        self.assertEqual(self.run_async(main), ([30, -1, 3000], [True, False, True]))
+
+    def test_error_code(self):
+        '''シーケンサがエラーを返した場合のテスト。'''
+        async def main(fx5):
+            with self.assertRaisesRegex(Exception, '0xC056'):
+                await fx5.read('D8000')
+            with self.assertRaisesRegex(Exception, 'Out of range'):
+                await fx5.write('D500', 65536)
+            await fx5.write('D500', 30)
+            return await fx5.read('D500')
+        self.assertEqual(self.run_async(main), 30)
+
+    def test_cancel(self):
+        '''応答待ちでキャンセルされた場合のテスト。'''
+        async def main(fx5):
+            await fx5.write('D500', 111)
+            await fx5.write('D600', 222)
+            FakePLC.hold = hold = threading.Event()
+            try:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(fx5.read('D500'), 0.1)
+            finally:
+                FakePLC.hold = None
+                hold.set()
+            # 読まれなかった応答を次の読み込みで受け取らない
+            return await fx5.read('D600')
+        self.assertEqual(self.run_async(main), 222)
+
+
 if __name__ == '__main__':
     unittest.main()